@@ -16,23 +16,41 @@ Components:
 
 Functions:
 - aes_encrypt: Encrypts plaintext using AES with the provided key.
+- aes_encrypt_into: Encrypts plaintext using AES into a preallocated ciphertext buffer.
+- aes_encrypt_many: Encrypts plaintext under a batch of keys (AES-NI when aes_ni.dll is available).
+- check_keys: Checks a batch of candidate keys against the expected ciphertext.
 - hex_to_bin: Converts a hexadecimal string to a binary string.
+- build_oracle: Builds (and caches) the oracle circuit for a target state.
 - create_oracle: Creates the oracle part of the Grover's circuit, which marks the correct key.
 - create_diffuser: Creates the diffuser part of the Grover's circuit, which amplifies the probability of the correct key.
+- num_grover_iterations: Returns the (cached) number of Grover iterations for a number of qubits.
 - grovers_algorithm: Assembles the full Grover's algorithm circuit.
-- execute_grover: Executes the Grover's circuit on AerSimulator.
+- create_backend: Creates the AerSimulator backend, preferring a single-precision GPU statevector.
+- compile_grover: Transpiles the Grover's circuits for the backend, reusing a cached pass manager.
+- execute_grover: Executes the Grover's circuit (or a list of circuits, in parallel) on AerSimulator.
 
 Usage:
 1. Ensure the AES shared library (DLL) is in the same directory as this script.
 2. If you are not running Python3.9.0 or below, create a virtual environment with Python3.9.0. Instructions are detailed in the README.md file.
 3. Install necessary Python packages: qiskit, qiskit-aer, numpy, matplotlib.
-5. Run the script.
+5. Run the script. Set the HEADLESS environment variable to save the histogram to counts.png instead of showing it.
 """
 
 import ctypes
 import os
+from functools import lru_cache
 import numpy as np
+import matplotlib
+
+# Run without a display (e.g. in CI or batch sweeps): use the non-interactive Agg backend and save the plot
+HEADLESS = bool(os.environ.get('HEADLESS'))
+if HEADLESS:
+    matplotlib.use('Agg')
+
 from qiskit import QuantumCircuit, transpile
+from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
+from qiskit.circuit.library import UnitaryGate
+from qiskit.quantum_info import Operator
 from qiskit_aer import AerSimulator
 from qiskit.visualization import plot_histogram
 import matplotlib.pyplot as plt
@@ -44,17 +62,34 @@ aes_lib = ctypes.CDLL(os.path.join(os.path.dirname(__file__),"..",'aes.dll'), wi
 aes_lib.encrypt.argtypes = [ctypes.POINTER(ctypes.c_ubyte), ctypes.POINTER(ctypes.c_ubyte), ctypes.POINTER(ctypes.c_ubyte)]
 aes_lib.encrypt.restype = None
 
-def aes_encrypt(key, plaintext):
+# Load the optional AES-NI shared library (built from aes_ni.c) for batched encryption
+try:
+    aes_ni_lib = ctypes.CDLL(os.path.join(os.path.dirname(__file__),"..",'aes_ni.dll'), winmode=0)
+    aes_ni_lib.encrypt_many.argtypes = [ctypes.POINTER(ctypes.c_ubyte), ctypes.POINTER(ctypes.c_ubyte), ctypes.POINTER(ctypes.c_ubyte), ctypes.c_size_t]
+    aes_ni_lib.encrypt_many.restype = None
+except OSError:
+    aes_ni_lib = None
+
+# Preallocated scratch buffers reused by every scalar encryption, so checking a key does not allocate
+# ctypes arrays. They are shared, so aes_encrypt and aes_encrypt_into are not thread-safe.
+_key_buf = (ctypes.c_ubyte * 16)()
+_pt_buf = (ctypes.c_ubyte * 16)()
+_ct_buf = (ctypes.c_ubyte * 16)()  # Assuming 128-bit AES
+
+def aes_encrypt_into(key, plaintext, out):
     """
-    Encrypts the given plaintext with the provided key using the AES encryption.
+    Encrypts the given plaintext with the provided key using the AES encryption, writing the
+    ciphertext into a caller-provided buffer.
+
+    Not thread-safe: the key and plaintext are copied into the shared module-level scratch buffers.
 
     :param key: The encryption key in hexadecimal format (32 hex characters)
     :param plaintext: The plaintext to be encrypted
-    :return: The ciphertext resulting from the encryption
+    :param out: A 16-byte ctypes array (c_ubyte * 16) receiving the ciphertext
+    :return: The out buffer, which is overwritten by the next call using it
     """
     key_bytes = bytes.fromhex(key)
     plaintext_bytes = plaintext.encode('utf-8')
-    ciphertext = (ctypes.c_ubyte * 16)()  # Assuming 128-bit AES
 
     # Ensure key and plaintext are correctly padded/truncated to 16 bytes
     if len(key_bytes) != 16:
@@ -64,64 +99,127 @@ def aes_encrypt(key, plaintext):
     if len(plaintext_bytes) < 16:
         plaintext_bytes += b'\x00' * (16 - len(plaintext_bytes))  # Pad with null bytes if necessary
 
-    # Convert key and plaintext to ctypes arrays
-    key_array = (ctypes.c_ubyte * 16).from_buffer_copy(key_bytes)
-    plaintext_array = (ctypes.c_ubyte * 16).from_buffer_copy(plaintext_bytes)
+    # Copy key and plaintext into the scratch buffers
+    ctypes.memmove(_key_buf, key_bytes, 16)
+    ctypes.memmove(_pt_buf, plaintext_bytes, 16)
 
     # Call the AES encryption function from the shared library
-    aes_lib.encrypt(key_array, plaintext_array, ciphertext)
-    return bytes(ciphertext)
+    aes_lib.encrypt(_key_buf, _pt_buf, out)
+    return out
 
-def create_oracle(nqubits, plaintext, expected_ciphertext):
+def aes_encrypt(key, plaintext):
     """
-    Creates the oracle circuit for Grover's algorithm.
+    Encrypts the given plaintext with the provided key using the AES encryption.
 
-    :param nqubits: The number of qubits
+    Not thread-safe: the encryption goes through the shared module-level scratch buffers, including
+    the ciphertext buffer, which is copied into the returned bytes.
+
+    :param key: The encryption key in hexadecimal format (32 hex characters)
+    :param plaintext: The plaintext to be encrypted
+    :return: The ciphertext resulting from the encryption
+    """
+    return bytes(aes_encrypt_into(key, plaintext, _ct_buf))
+
+def aes_encrypt_many(keys, plaintext):
+    """
+    Encrypts the given plaintext under each of the provided keys using the AES encryption.
+
+    Uses the AES-NI batched encrypt_many from aes_ni.dll when it is available, otherwise falls back
+    to calling the scalar encrypt function once per key. Unlike aes_encrypt, it does not use the shared
+    scratch buffers.
+
+    :param keys: The encryption keys as a (N, 16) uint8 array
+    :param plaintext: The plaintext to be encrypted
+    :return: The ciphertexts as a (N, 16) uint8 array
+    """
+    keys = np.ascontiguousarray(keys, dtype=np.uint8)
+    plaintext_bytes = plaintext.encode('utf-8')
+
+    # Ensure keys and plaintext are correctly padded/truncated to 16 bytes
+    if keys.ndim != 2 or keys.shape[1] != 16:
+        raise ValueError("Keys must be an array of 16 byte keys")
+    if len(plaintext_bytes) > 16:
+        raise ValueError("Plaintext must be at most 16 bytes")
+    if len(plaintext_bytes) < 16:
+        plaintext_bytes += b'\x00' * (16 - len(plaintext_bytes))  # Pad with null bytes if necessary
+
+    plaintext_array = (ctypes.c_ubyte * 16).from_buffer_copy(plaintext_bytes)
+    ciphertexts = np.empty_like(keys)
+    ubyte_p = ctypes.POINTER(ctypes.c_ubyte)
+
+    if aes_ni_lib is not None:
+        aes_ni_lib.encrypt_many(keys.ctypes.data_as(ubyte_p), plaintext_array, ciphertexts.ctypes.data_as(ubyte_p), len(keys))
+    else:
+        # Encrypt each key in place, straight from and into the numpy rows
+        for key_row, ciphertext_row in zip(keys, ciphertexts):
+            aes_lib.encrypt(key_row.ctypes.data_as(ubyte_p), plaintext_array, ciphertext_row.ctypes.data_as(ubyte_p))
+    return ciphertexts
+
+def check_keys(keys, plaintext, expected_ciphertext):
+    """
+    Checks which of the given keys produce the expected ciphertext, encrypting them in one batch.
+
+    :param keys: The candidate keys as a (N, 16) uint8 array
     :param plaintext: The plaintext to be encrypted
     :param expected_ciphertext: The expected ciphertext to compare against
-    :return: The oracle gate
+    :return: A boolean array, True where the key produces the expected ciphertext
     """
-    oracle = QuantumCircuit(nqubits + 1)  # +1 for the ancilla qubit
+    expected = np.frombuffer(expected_ciphertext, dtype=np.uint8)
+    return np.all(aes_encrypt_many(keys, plaintext) == expected, axis=1)
 
-    def check_key(key_bits):
-        """
-        Checks if the given key bits produce the expected ciphertext.
+@lru_cache(maxsize=256)
+def build_oracle(nqubits, target_bytes):
+    """
+    Builds the oracle circuit marking the given target state, cached per target.
 
-        :param key_bits: The key bits to check
-        :return: True if the key produces the expected ciphertext, False otherwise
-        """
-        key = ''.join(map(str, key_bits))
-        encrypted = aes_encrypt(key, plaintext)
-        return encrypted == expected_ciphertext
+    Repeated calls for the same target (e.g. retries or sweeps against one ciphertext) reuse the same
+    circuit instead of rebuilding it. The returned circuit is shared and must not be modified in place.
 
-    # For simplicity, let's assume the target state is all '1's
-    target_state = '1' * nqubits  # Update this as necessary
+    :param nqubits: The number of qubits
+    :param target_bytes: The target state bit array as bytes (one 0/1 byte per qubit), hashable for the cache
+    :return: The oracle circuit
+    """
+    oracle = QuantumCircuit(nqubits)
+
+    # Qubits corresponding to '0' in the target state, computed once for both X layers
+    target_bits = np.frombuffer(target_bytes, dtype=np.uint8)
+    zero_positions = np.nonzero(target_bits == 0)[0].tolist()
 
     # Apply X gates to qubits corresponding to '0' in the target state
-    for i, bit in enumerate(target_state):
-        if bit == '0':
-            oracle.x(i)
+    if zero_positions:
+        oracle.x(zero_positions)
 
-    # Add Hadamard gate to the ancilla qubit and perform the multi-controlled Toffoli gate
-    oracle.h(nqubits)  # Hadamard on ancilla
-    oracle.mcx(list(range(nqubits)), nqubits)  # Multi-controlled Toffoli
-    oracle.h(nqubits)  # Hadamard on ancilla
+    # Flip the phase of the target state with a multi-controlled Z (H-MCX-H on the last qubit),
+    # so no phase-kickback ancilla is needed
+    oracle.h(nqubits - 1)
+    oracle.mcx(list(range(nqubits - 1)), nqubits - 1)  # Multi-controlled Toffoli
+    oracle.h(nqubits - 1)
 
     # Apply X gates again to qubits corresponding to '0' in the target state
-    for i, bit in enumerate(target_state):
-        if bit == '0':
-            oracle.x(i)
+    if zero_positions:
+        oracle.x(zero_positions)
+
+    oracle.name = "Oracle"
+    return oracle
+
+def create_oracle(nqubits):
+    """
+    Creates the oracle circuit for Grover's algorithm.
+
+    :param nqubits: The number of qubits
+    :return: The (shared, cached) oracle circuit
+    """
+    # For simplicity, let's assume the target state is all '1's
+    target_bits = np.ones(nqubits, dtype=np.uint8)  # Update this as necessary
 
-    oracle_gate = oracle.to_gate()
-    oracle_gate.name = "Oracle"
-    return oracle_gate
+    return build_oracle(nqubits, target_bits.tobytes())
 
 def create_diffuser(nqubits):
     """
     Creates the diffuser circuit for Grover's algorithm.
 
     :param nqubits: The number of qubits
-    :return: The diffuser gate
+    :return: The diffuser circuit
     """
     diffuser = QuantumCircuit(nqubits)
     diffuser.h(range(nqubits))
@@ -131,72 +229,157 @@ def create_diffuser(nqubits):
     diffuser.h(nqubits - 1)
     diffuser.x(range(nqubits))
     diffuser.h(range(nqubits))
-    diffuser_gate = diffuser.to_gate()
-    diffuser_gate.name = "Diffuser"
-    return diffuser_gate
+    diffuser.name = "Diffuser"
+    return diffuser
 
-def grovers_algorithm(nqubits, plaintext, expected_ciphertext):
+@lru_cache(maxsize=None)
+def num_grover_iterations(nqubits):
+    """
+    Returns the optimal number of Grover iterations for the given number of qubits.
+
+    :param nqubits: The number of qubits
+    :return: The number of Grover iterations
+    """
+    return int(np.pi / 4 * np.sqrt(float(2**nqubits)))
+
+# Largest circuit width (in qubits) for which a Grover iteration is fused into a single dense unitary
+FUSED_ITERATION_MAX_QUBITS = 10
+
+def grovers_algorithm(nqubits, backend):
     """
     Implements Grover's algorithm to search for the target key.
 
     :param nqubits: The number of qubits
-    :param plaintext: The plaintext to be encrypted
-    :param expected_ciphertext: The expected ciphertext to compare against
+    :param backend: The backend the circuit will be executed on
     :return: The Grover circuit
     """
-    grover = QuantumCircuit(nqubits + 1, nqubits)  # +1 for the ancilla qubit
+    grover = QuantumCircuit(nqubits, nqubits)
     grover.h(range(nqubits))  # Apply Hadamard gates to all qubits to create superposition
-    grover.x(nqubits)  # Initialize ancilla qubit to |1>
-    grover.h(nqubits)
 
-    oracle_gate = create_oracle(nqubits, plaintext, expected_ciphertext)
-    diffuser_gate = create_diffuser(nqubits)
+    oracle = create_oracle(nqubits)
+    diffuser = create_diffuser(nqubits)
 
-    # Determine the number of iterations for Grover's algorithm
-    num_iterations = int(np.pi / 4 * np.sqrt(float(2**nqubits)))
-    for _ in range(num_iterations):
-        grover.append(oracle_gate, range(nqubits + 1))
-        grover.append(diffuser_gate, range(nqubits))
+    num_iterations = num_grover_iterations(nqubits)
+    if nqubits <= FUSED_ITERATION_MAX_QUBITS:
+        # Fuse all iterations (diffuser after oracle) into a single dense unitary
+        iterations = Operator(oracle.compose(diffuser)).power(num_iterations)
+        grover.append(UnitaryGate(iterations, label=f'G^{num_iterations}'), grover.qubits)
+    else:
+        # Decompose the iteration to the backend basis once, outside the iteration loop
+        iteration = transpile(oracle.compose(diffuser), backend, optimization_level=3)
+        for _ in range(num_iterations):
+            grover.compose(iteration, inplace=True)
 
     grover.measure(range(nqubits), range(nqubits))
     return grover
 
-def execute_grover(grover_circuit):
+def create_backend():
     """
-    Executes the Grover circuit on the AerSimulator.
+    Creates the AerSimulator backend used to run the Grover circuit.
 
-    :param grover_circuit: The Grover circuit to be executed
-    :return: The result counts from the execution
-    """
-    backend = AerSimulator()
-    compiled_circuit = transpile(grover_circuit, backend)
-    result = backend.run(compiled_circuit, shots=1024).result()
-    counts = result.get_counts(grover_circuit)
-    return counts
-
-nqubits = 4  # Number of qubits for an intermediate test case
-plaintext = "This is a test"  # Example plaintext (16 bytes)
-key = "00112233445566778899aabbccddeeff"  # The correct key (16 bytes)
-expected_ciphertext = bytes.fromhex('3c86e7ec17bb967b9da2f2242d94a634')
+    The statevector is simulated on the GPU in single precision (cuStateVec) when this qiskit-aer build
+    reports a GPU device, since consumer GPUs are far slower in double precision. Uses the CPU otherwise,
+    still in single precision: complex64 amplitudes halve the memory traffic of every gate, and Grover only
+    relies on amplitude signs and relative magnitudes.
 
-# Encrypt the plaintext using the provided key
-ciphertext = aes_encrypt(key, plaintext)
+    :return: The configured AerSimulator backend
+    """
+    # The device is not checked until the first run, so pick it from the devices Aer reports
+    if 'GPU' in AerSimulator().available_devices():
+        backend = AerSimulator(method='statevector', device='GPU', precision='single', cuStateVec_enable=True)
+    else:
+        backend = AerSimulator(method='statevector', device='CPU', precision='single')
+
+    # Fuse the long runs of H/X/MCX gates into larger unitaries. The default threshold (14 qubits)
+    # would leave fusion disabled for the small circuits used here.
+    backend.set_options(fusion_enable=True, fusion_threshold=3, fusion_max_qubit=5)
+    return backend
+
+# Preset pass managers, keyed on (backend, optimization level). Keyed on the backend object itself,
+# since two backends with the same name can have different targets.
+PASS_MANAGERS = {}
+
+def compile_grover(grover_circuits, backend, optimization_level=1):
+    """
+    Transpiles the Grover circuits for the backend.
 
-# Verify if the produced ciphertext matches the expected ciphertext
-if ciphertext != expected_ciphertext:
-    print(f"Error: The AES encryption function did not produce the expected ciphertext.")
-else:
-    print("Success: The AES encryption function produced the expected ciphertext")
+    The preset pass manager is built only once per backend and optimization level, and reused across
+    calls. All circuits go through a single run of it, which transpiles them in parallel.
 
-# Create the Grover circuit
-grover_circuit = grovers_algorithm(nqubits, plaintext, expected_ciphertext)
+    :param grover_circuits: The list of Grover circuits to be transpiled
+    :param backend: The backend to transpile for
+    :param optimization_level: The transpiler optimization level
+    :return: The list of transpiled circuits
+    """
+    key = (backend, optimization_level)
+    if key not in PASS_MANAGERS:
+        PASS_MANAGERS[key] = generate_preset_pass_manager(optimization_level=optimization_level, backend=backend)
+    return PASS_MANAGERS[key].run(grover_circuits)
 
-# Execute the Grover circuit
-counts = execute_grover(grover_circuit)
+def execute_grover(grover_circuits, backend, blocking_qubits=None):
+    """
+    Executes the Grover circuit(s) on the AerSimulator.
 
-# Display the result counts
-print("Counts:", counts)
-plot_histogram(counts).show()
+    A list of circuits (e.g. a sweep over plaintext/ciphertext pairs) is submitted as a single job,
+    with the experiments run in parallel instead of one after the other. These settings are passed as
+    run options, so they do not stick to the shared backend.
 
-# Keep the plot window open
-plt.show()
+    :param grover_circuits: The Grover circuit, or a list of Grover circuits, to be executed
+    :param backend: The AerSimulator backend to run the circuits on
+    :param blocking_qubits: For multi-GPU/MPI runs only, the number of qubits per statevector chunk
+                            (must be smaller than the circuit width); None disables blocking
+    :return: The result counts from the execution (a list of counts for a list of circuits)
+    """
+    circuits = grover_circuits if isinstance(grover_circuits, list) else [grover_circuits]
+    compiled_circuits = compile_grover(circuits, backend)
+
+    run_options = {}
+    if len(circuits) > 1:
+        run_options.update(parallel_experiments=os.cpu_count(), max_parallel_threads=os.cpu_count())
+
+    if blocking_qubits is not None:
+        if blocking_qubits >= max(circuit.num_qubits for circuit in compiled_circuits):
+            raise ValueError("blocking_qubits must be smaller than the circuit width")
+        # Split the statevector into chunks distributed over the GPUs/MPI processes
+        run_options.update(blocking_enable=True, blocking_qubits=blocking_qubits)
+
+    result = backend.run(compiled_circuits, shots=1024, **run_options).result()
+    counts = [result.get_counts(i) for i in range(len(circuits))]
+    return counts if isinstance(grover_circuits, list) else counts[0]
+
+# Run the search only when executed as a script, so the functions above can be imported by the tests
+if __name__ == '__main__':
+    nqubits = 4  # Number of qubits for an intermediate test case
+    plaintext = "This is a test"  # Example plaintext (16 bytes)
+    key = "00112233445566778899aabbccddeeff"  # The correct key (16 bytes)
+    expected_ciphertext = bytes.fromhex('3c86e7ec17bb967b9da2f2242d94a634')
+
+    # Encrypt the plaintext using the provided key
+    ciphertext = aes_encrypt(key, plaintext)
+
+    # Verify if the produced ciphertext matches the expected ciphertext
+    if ciphertext != expected_ciphertext:
+        print(f"Error: The AES encryption function did not produce the expected ciphertext.")
+    else:
+        print("Success: The AES encryption function produced the expected ciphertext")
+
+    # Create the simulator backend
+    backend = create_backend()
+
+    # Create the Grover circuit
+    grover_circuit = grovers_algorithm(nqubits, backend)
+
+    # Execute the Grover circuit
+    counts = execute_grover(grover_circuit, backend)
+
+    # Display the result counts
+    print("Counts:", counts)
+    fig = plot_histogram(counts)
+
+    if HEADLESS:
+        fig.savefig('counts.png', dpi=100)
+    else:
+        fig.show()
+
+        # Keep the plot window open
+        plt.show()
@@ -1,5 +1,7 @@
 import ctypes
+import importlib.util
 import os
+import numpy as np
 
 # Full path to the shared library
 #aes_lib = ctypes.CDLL('C:/Path/to/Grovers-Search_Algorithm/aes.dll', winmode=0)
@@ -44,3 +46,31 @@ if ciphertext != expected_ciphertext:
     print(f"Error: The AES encryption function did not produce the expected ciphertext.")
 else:
     print("Success: The AES encryption function produced the expected ciphertext.")
+
+# Batched encryption (aes_encrypt_many) and key checking (check_keys) from the Grover script,
+# checked against aes_encrypt through both aes_ni.dll (when built) and the aes.dll fallback
+spec = importlib.util.spec_from_file_location('grovers_algorithm_aer', os.path.join(os.path.dirname(__file__), 'grovers-algorithm-Aer.py'))
+grovers_aer = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(grovers_aer)
+
+# 7 keys (not a multiple of 4), so both the 4-wide and the remainder paths of aes_ni.dll are used
+keys = [key] + ["%02x" % i + key[2:] for i in range(1, 7)]
+keys_array = np.frombuffer(b''.join(bytes.fromhex(k) for k in keys), dtype=np.uint8).reshape(len(keys), 16)
+expected_ciphertexts = [aes_encrypt(k, plaintext) for k in keys]
+
+libraries = [("aes.dll", None)]
+if grovers_aer.aes_ni_lib is None:
+    print("Skipping AES-NI batched encryption test: aes_ni.dll not found.")
+else:
+    libraries.append(("aes_ni.dll", grovers_aer.aes_ni_lib))
+
+for name, aes_ni_lib in libraries:
+    grovers_aer.aes_ni_lib = aes_ni_lib
+    ciphertexts = [bytes(ct) for ct in grovers_aer.aes_encrypt_many(keys_array, plaintext)]
+    matches = grovers_aer.check_keys(keys_array, plaintext, expected_ciphertext).tolist()
+
+    # Only the first key is the correct one
+    if ciphertexts != expected_ciphertexts or matches != [True] + [False] * (len(keys) - 1):
+        print(f"Error: The batched AES encryption ({name}) did not produce the expected ciphertexts.")
+    else:
+        print(f"Success: The batched AES encryption ({name}) produced the expected ciphertexts.")
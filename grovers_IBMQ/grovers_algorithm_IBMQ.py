@@ -14,7 +14,7 @@ Grover's Algorithm is a quantum search algorithm that provides a quadratic speed
 This script includes:
 1. AES encryption function in C, interfaced with Python using ctypes.
 2. Grover's Algorithm implemented using Qiskit, a quantum computing framework.
-3. Execution of the quantum circuit on IBMQ's quantum hardware.
+3. Execution of the quantum circuit on IBMQ's quantum hardware, or on a local matrix product state simulator for debugging.
 4. Visualization of the results.
 
 Components:
@@ -22,28 +22,42 @@ Components:
 - Grover's Algorithm: Quantum search algorithm that searches for the correct AES key in a superposition of possible keys.
 - Qiskit: A Python library for quantum computing. Used here to create and execute the quantum circuit.
 - IBMQ: IBM's quantum cloud platform, used to run the quantum circuit on real quantum hardware.
+- AerSimulator: Qiskit's simulator, used with the matrix product state method to debug the 128-qubit circuit locally.
 
 Functions:
 - aes_encrypt: Encrypts plaintext using AES with the provided key.
-- hex_to_bin: Converts a hexadecimal string to a binary string.
+- hex_to_bits: Converts a hexadecimal string to a bit array.
+- build_oracle: Builds (and caches) the oracle circuit for a target key.
 - create_oracle: Creates the oracle part of the Grover's circuit, which marks the correct key.
 - create_diffuser: Creates the diffuser part of the Grover's circuit, which amplifies the probability of the correct key.
 - grovers_algorithm: Assembles the full Grover's algorithm circuit.
-- execute_grover: Executes the Grover's circuit on IBMQ's least busy backend.
+- execute_grover: Executes the Grover's circuit (or a batch of circuits, in one job) on IBMQ's least busy backend.
+- execute_grover_local: Executes the Grover's circuit on a local matrix product state AerSimulator.
 
 Usage:
 1. Ensure the AES shared library (DLL) is in the same directory as this script.
 2. If you are not running Python3.12.4 or below, create a virtual environment with Python3.12.4. Instructions are detailed in the README.md.
 3. Install necessary Python packages: Qiskit, numpy, matplotlib.
 4. Replace the placeholder in IBMQ.save_account('YOUR_API_TOKEN') with your actual IBMQ API token.
-5. Run the script.
+5. Run the script. Set the LOCAL_SIM environment variable to run on the local simulator instead of IBMQ
+   (requires qiskit-aer). The local run searches only the first LOCAL_SIM_NQUBITS bits of the key.
+   Set the HEADLESS environment variable to save the histogram to counts.png instead of showing it.
 """
 
 import ctypes
 import os
+from functools import lru_cache
 import numpy as np
+import matplotlib
+
+# Run without a display (e.g. in CI or batch sweeps): use the non-interactive Agg backend and save the plot
+HEADLESS = bool(os.environ.get('HEADLESS'))
+if HEADLESS:
+    matplotlib.use('Agg')
+
 from qiskit import QuantumCircuit, transpile
-from qiskit_ibm_runtime import QiskitRuntimeService, Session, Sampler
+from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
+from qiskit_ibm_runtime import QiskitRuntimeService, Session, SamplerV2 as Sampler
 from qiskit.visualization import plot_histogram
 import matplotlib.pyplot as plt
 
@@ -82,50 +96,66 @@ def aes_encrypt(key, plaintext):
     aes_lib.encrypt(key_array, plaintext_array, ciphertext)
     return bytes(ciphertext)
 
-def hex_to_bin(hex_string):
+def hex_to_bits(hex_string):
     """
-    Converts a hexadecimal string to a binary string.
+    Converts a hexadecimal string to a bit array.
 
-    :param hex_string: The hexadecimal string to be converted
-    :return: The binary representation of the hexadecimal string
+    :param hex_string: The hexadecimal string to be converted (32 hex characters for a 128-bit key)
+    :return: The bits of the hexadecimal string as a uint8 array
     """
-    return bin(int(hex_string, 16))[2:].zfill(128)  # 128-bit key
+    return np.unpackbits(np.frombuffer(bytes.fromhex(hex_string), dtype=np.uint8))  # Most significant bit first
 
-def create_oracle(nqubits, target_key_bin):
+@lru_cache(maxsize=256)
+def build_oracle(nqubits, target_key_bytes):
     """
-    Creates the oracle circuit for Grover's algorithm.
+    Builds the oracle circuit marking the given target key, cached per target.
+
+    Repeated calls for the same target (e.g. retries or sweeps against one ciphertext) reuse the same
+    circuit instead of rebuilding it. The returned circuit is shared and must not be modified in place.
 
     :param nqubits: The number of qubits
-    :param target_key_bin: The target key in binary format
-    :return: The oracle gate
+    :param target_key_bytes: The target key bit array as bytes (one 0/1 byte per qubit), hashable for the cache
+    :return: The oracle circuit
     """
-    oracle = QuantumCircuit(nqubits + 1)  # +1 for the ancilla qubit
+    oracle = QuantumCircuit(nqubits)
 
-    # Apply X gates to qubits corresponding to '0' in the target key binary string
-    for i, bit in enumerate(target_key_bin):
-        if bit == '0':
-            oracle.x(i)
+    # Qubits corresponding to '0' in the target key, computed once for both X layers
+    target_key_bits = np.frombuffer(target_key_bytes, dtype=np.uint8)
+    zero_positions = np.nonzero(target_key_bits == 0)[0].tolist()
 
-    # Add Hadamard gate to the ancilla qubit and perform the multi-controlled Toffoli gate
-    oracle.h(nqubits)
-    oracle.mcx(list(range(nqubits)), nqubits)
-    oracle.h(nqubits)
+    # Apply X gates to qubits corresponding to '0' in the target key
+    if zero_positions:
+        oracle.x(zero_positions)
 
-    # Apply X gates again to qubits corresponding to '0' in the target key binary string
-    for i, bit in enumerate(target_key_bin):
-        if bit == '0':
-            oracle.x(i)
+    # Flip the phase of the target state with a multi-controlled Z (H-MCX-H on the last qubit),
+    # so no phase-kickback ancilla is needed
+    oracle.h(nqubits - 1)
+    oracle.mcx(list(range(nqubits - 1)), nqubits - 1)
+    oracle.h(nqubits - 1)
 
-    oracle_gate = oracle.to_gate()
-    oracle_gate.name = "Oracle"
-    return oracle_gate
+    # Apply X gates again to qubits corresponding to '0' in the target key
+    if zero_positions:
+        oracle.x(zero_positions)
+
+    oracle.name = "Oracle"
+    return oracle
+
+def create_oracle(nqubits, target_key_bits):
+    """
+    Creates the oracle circuit for Grover's algorithm.
+
+    :param nqubits: The number of qubits
+    :param target_key_bits: The target key as a bit array
+    :return: The (shared, cached) oracle circuit
+    """
+    return build_oracle(nqubits, target_key_bits.tobytes())
 
 def create_diffuser(nqubits):
     """
     Creates the diffuser circuit for Grover's algorithm.
 
     :param nqubits: The number of qubits
-    :return: The diffuser gate
+    :return: The diffuser circuit
     """
     diffuser = QuantumCircuit(nqubits)
     diffuser.h(range(nqubits))
@@ -135,53 +165,92 @@ def create_diffuser(nqubits):
     diffuser.h(nqubits - 1)
     diffuser.x(range(nqubits))
     diffuser.h(range(nqubits))
-    diffuser_gate = diffuser.to_gate()
-    diffuser_gate.name = "Diffuser"
-    return diffuser_gate
+    diffuser.name = "Diffuser"
+    return diffuser
 
-def grovers_algorithm(nqubits, target_key_bin):
+def grovers_algorithm(nqubits, target_key_bits):
     """
     Implements Grover's algorithm to search for the target key.
 
     :param nqubits: The number of qubits
-    :param target_key_bin: The target key in binary format
+    :param target_key_bits: The target key as a bit array
     :return: The Grover circuit
     """
-    grover = QuantumCircuit(nqubits + 1, nqubits)  # +1 for the ancilla qubit
+    grover = QuantumCircuit(nqubits, nqubits)
     grover.h(range(nqubits))  # Apply Hadamard gates to all qubits to create superposition
-    grover.x(nqubits)  # Initialize ancilla qubit to |1>
-    grover.h(nqubits)
 
-    oracle_gate = create_oracle(nqubits, target_key_bin)
-    diffuser_gate = create_diffuser(nqubits)
+    # One Grover iteration: the oracle followed by the diffuser
+    iteration = create_oracle(nqubits, target_key_bits).compose(create_diffuser(nqubits))
 
     # Determine the number of iterations for Grover's algorithm
     num_iterations = int(np.pi / 4 * np.sqrt(float(2**nqubits)))
     for _ in range(num_iterations):
-        grover.append(oracle_gate, range(nqubits + 1))
-        grover.append(diffuser_gate, range(nqubits))
+        grover.compose(iteration, qubits=range(nqubits), inplace=True)
 
     grover.measure(range(nqubits), range(nqubits))
     return grover
 
-def execute_grover(grover_circuit):
+def execute_grover(grover_circuits):
     """
-    Executes the Grover circuit on the least busy IBM Q backend.
+    Executes the Grover circuit(s) on the least busy IBM Q backend.
 
-    :param grover_circuit: The Grover circuit to be executed
-    :return: The result counts from the execution
+    The circuits are transpiled once with a preset pass manager and submitted together as the PUBs of a
+    single SamplerV2 job, so the per-job queueing and compilation cost is paid once per batch.
+
+    :param grover_circuits: The Grover circuit, or a list of Grover circuits, to be executed
+    :return: The result counts from the execution (a list of counts for a list of circuits)
     """
+    circuits = grover_circuits if isinstance(grover_circuits, list) else [grover_circuits]
+
     service = QiskitRuntimeService()
-    backend = service.least_busy_backend(minimum_qubits=nqubits, simulator=False)
+    backend = service.least_busy(min_num_qubits=max(circuit.num_qubits for circuit in circuits), simulator=False, operational=True)
 
-    with Session(service=service, backend=backend) as session:
-        sampler = Sampler(session=session)
-        job = sampler.run(circuits=[grover_circuit])
+    # Transpile to the backend's instruction set architecture once, for all circuits
+    pass_manager = generate_preset_pass_manager(optimization_level=3, backend=backend)
+    isa_circuits = pass_manager.run(circuits)
+
+    with Session(backend=backend) as session:
+        sampler = Sampler(mode=session)
+        job = sampler.run([(isa_circuit,) for isa_circuit in isa_circuits], shots=1024)
         result = job.result()
-        counts = result.get_counts(grover_circuit)
-        return counts
+
+    # Counts are stored under the name of each circuit's classical register
+    counts = [getattr(pub_result.data, circuit.cregs[0].name).get_counts()
+              for circuit, pub_result in zip(circuits, result)]
+    return counts if isinstance(grover_circuits, list) else counts[0]
+
+def execute_grover_local(grover_circuit):
+    """
+    Executes the Grover circuit on a local AerSimulator, for debugging without IBMQ access.
+
+    The matrix product state method is used, since it scales to far wider circuits than a statevector.
+    It stores the state as a chain of low-rank tensors, which keeps the Hadamard initialization and the
+    local X gates cheap. The bond dimension is capped, and small singular values are truncated, because the
+    MCX across all qubits would otherwise blow it up. It still supports at most 63 qubits, so the circuit
+    must be a reduced-width one (see LOCAL_SIM_NQUBITS).
+
+    qiskit-aer is only needed for this local path, so it is imported here rather than at module level.
+
+    :param grover_circuit: The Grover circuit to be executed
+    :return: The result counts from the execution
+    """
+    from qiskit_aer import AerSimulator
+
+    backend = AerSimulator(method='matrix_product_state',
+                           matrix_product_state_max_bond_dimension=64,
+                           matrix_product_state_truncation_threshold=1e-8)
+    compiled_circuit = transpile(grover_circuit, backend)
+    result = backend.run(compiled_circuit, shots=1024).result()
+    counts = result.get_counts(grover_circuit)
+    return counts
 
 nqubits = 128  # Number of qubits for a 128-bit key
+
+# Run on the local simulator instead of IBMQ, for debugging. The full 128-qubit search needs about 1.4e19
+# Grover iterations and the local simulator supports at most 63 qubits, so the local run only searches
+# the first LOCAL_SIM_NQUBITS bits of the key.
+LOCAL_SIM = bool(os.environ.get('LOCAL_SIM'))
+LOCAL_SIM_NQUBITS = 8
 plaintext = "This is a test"  # Example plaintext (16 bytes)
 key = "00112233445566778899aabbccddeeff"  # The correct key (16 bytes)
 expected_ciphertext = bytes.fromhex('3c86e7ec17bb967b9da2f2242d94a634')
@@ -195,18 +264,29 @@ if ciphertext != expected_ciphertext:
 else:
     print("Success: The AES encryption function produced the expected ciphertext")
 
-# Convert the target key to binary format
-target_key_bin = hex_to_bin(key)
+# Convert the target key to a bit array
+target_key_bits = hex_to_bits(key)
+if LOCAL_SIM:
+    nqubits = LOCAL_SIM_NQUBITS
+    target_key_bits = target_key_bits[:nqubits]
 
 # Create the Grover circuit
-grover_circuit = grovers_algorithm(nqubits, target_key_bin)
+grover_circuit = grovers_algorithm(nqubits, target_key_bits)
 
-# Execute the Grover circuit
-counts = execute_grover(grover_circuit)
+# Execute the Grover circuit, locally if requested
+if LOCAL_SIM:
+    counts = execute_grover_local(grover_circuit)
+else:
+    counts = execute_grover(grover_circuit)
 
 # Display the result counts
 print("Counts:", counts)
-plot_histogram(counts).show()
+fig = plot_histogram(counts)
+
+if HEADLESS:
+    fig.savefig('counts.png', dpi=100)
+else:
+    fig.show()
 
-# Keep the plot window open
-plt.show()
+    # Keep the plot window open
+    plt.show()